@@ -1,9 +1,12 @@
+import os
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # ======================== PAGE CONFIG ========================
 st.set_page_config(
@@ -29,17 +32,66 @@ st.markdown("""
 
 # ======================== DATA LOADING & PREPROCESSING ========================
 
-@st.cache_data
+CSV_PATH = Path("ticket.csv")
+PARQUET_PATH = CSV_PATH.with_suffix(".parquet")
+
+# Declared up front so the parser skips type inference and repeated labels
+# are stored once as category codes instead of per-row Python strings.
+# Date columns stay ``"string"`` so the PyArrow engine doesn't parse them itself
+# (and blank cells stay missing rather than becoming the text "None").
+CSV_DTYPES = {
+    "Ticket No": "string",
+    "Service Number": "category",
+    "Journey Date": "string",
+    "Seat Fare": "float32",
+    "Total Ticket Amount": "float32",
+    "Category": "category",
+    "Age": "Int16",  # nullable: a blank Age becomes <NA>, as NaN did before
+    "Gender": "category",
+    "Booked Date Time": "string",
+    "Journey Date Time": "string",
+}
+TIME_BUCKETS = ["Early Morning", "Day Service", "Evening", "Overnight"]
+
+# Per-filter caches are bounded so a long-running server doesn't keep one
+# entry per filter combination ever selected; CSV exports are the largest.
+FILTER_CACHE_ENTRIES = 128
+FIGURE_CACHE_ENTRIES = 256
+CSV_CACHE_ENTRIES = 8
+
+
+@st.cache_resource
 def load_and_preprocess():
-    """Load ticket.csv and replicate the notebook preprocessing pipeline."""
-    df = pd.read_csv("ticket.csv")
+    """Load ticket.csv and replicate the notebook preprocessing pipeline.
+
+    Held as a shared resource so reruns reuse the same frame instead of
+    unpickling a fresh copy; callers must treat it as read-only.
+
+    The preprocessed frame is written to a Parquet sidecar on first run and
+    reused on later cold starts, as long as it is newer than both the CSV and
+    this script (so edits to the pipeline below invalidate it). An unreadable
+    sidecar is ignored and rebuilt from the CSV.
+    """
+    source_mtime = max(CSV_PATH.stat().st_mtime, Path(__file__).stat().st_mtime)
+    if PARQUET_PATH.exists() and PARQUET_PATH.stat().st_mtime >= source_mtime:
+        try:
+            return pd.read_parquet(PARQUET_PATH)
+        except (OSError, pa.ArrowInvalid):
+            pass
+
+    # PyArrow (already required for the Parquet sidecar) parses in parallel.
+    df = pd.read_csv(CSV_PATH, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, engine="pyarrow")
 
     # --- Route extraction ---
-    df["Route"] = df["Service Number"].apply(lambda t: "-".join(t.split("-")[:2]))
+    df["Route"] = (
+        df["Service Number"].apply(lambda t: "-".join(t.split("-")[:2])).astype("category")
+    )
 
     # --- Sleeper / Seater flag ---
-    df["isSleeper"] = df["Service Number"].str.contains("SL").astype(int)
-    df["Bus Type"] = df["isSleeper"].map({0: "Seater", 1: "Sleeper"})
+    df["isSleeper"] = df["Service Number"].str.contains("SL").astype("int8")
+    df["Bus Type"] = pd.Categorical(
+        df["isSleeper"].map({0: "Seater", 1: "Sleeper"}), categories=["Seater", "Sleeper"]
+    )
 
     # --- Departure time & time bucket ---
     df["Departure Time"] = df["Service Number"].apply(
@@ -55,7 +107,9 @@ def load_and_preprocess():
             return "Evening"
         return "Overnight"
 
-    df["Time Of Travel"] = df["Departure Time"].apply(time_bucket)
+    df["Time Of Travel"] = pd.Categorical(
+        df["Departure Time"].apply(time_bucket), categories=TIME_BUCKETS
+    )
 
     # --- Datetime conversions ---
     df["Departure Date Time"] = pd.to_datetime(
@@ -65,7 +119,9 @@ def load_and_preprocess():
     df["Journey Date Time"] = pd.to_datetime(df["Journey Date Time"], format="mixed")
 
     # --- Booking gap ---
-    df["Booking Gap Days"] = (df["Journey Date Time"] - df["Booked Date Time"]).dt.days
+    df["Booking Gap Days"] = (
+        (df["Journey Date Time"] - df["Booked Date Time"]).dt.days.astype("Int16")
+    )
 
     # --- Age groups ---
     df["Age Group"] = pd.cut(
@@ -77,18 +133,256 @@ def load_and_preprocess():
     # --- Cleanup ---
     df.drop(columns=["Journey Date", "Departure Time"], inplace=True)
 
+    # --- Parquet sidecar (best effort: the app dir may be read-only) ---
+    # Written to a temp file and renamed into place, so an interrupted write
+    # never leaves a truncated sidecar behind.
+    tmp_path = PARQUET_PATH.with_suffix(f".{os.getpid()}.tmp.parquet")
+    try:
+        df.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, PARQUET_PATH)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
     return df
 
 
+@st.cache_data
+def filter_options(_df):
+    """Sidebar choices, read once from the category labels rather than per rerun."""
+    return {
+        "routes": tuple(sorted(_df["Route"].cat.categories)),
+        "categories": tuple(sorted(_df["Category"].cat.categories)),
+        "genders": tuple(sorted(_df["Gender"].cat.categories)),
+        "fare_min": int(_df["Seat Fare"].min()),
+        "fare_max": int(_df["Seat Fare"].max()),
+    }
+
+
+FILTER_COLUMNS = ["Route", "Category", "Time Of Travel", "Bus Type", "Gender", "Age Group"]
+
+
+@st.cache_resource
+def filter_codes(_df):
+    """Contiguous int16 category codes and label → code maps for the filter columns."""
+    code_arrays = {c: _df[c].cat.codes.to_numpy().astype(np.int16) for c in FILTER_COLUMNS}
+    code_maps = {
+        c: {label: i for i, label in enumerate(_df[c].cat.categories)} for c in FILTER_COLUMNS
+    }
+    return code_arrays, code_maps
+
+
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES)
+def filter_rows(_df, routes, categories, times, bus_types, genders, age_groups, fare_range):
+    """Positions of the rows of ``_df`` matching every active sidebar filter.
+
+    Selections arrive as sorted tuples so each filter combination is memoised
+    once; ``_df`` is the cached dataset and is left out of the cache key.
+    Categorical filters compare precomputed int16 codes against the selected
+    labels' codes, and all masks are AND-ed together. Only the row
+    positions are cached, and ``None`` means every row matches, so callers
+    can use ``_df`` itself without a copy.
+    """
+    code_arrays, code_maps = filter_codes(_df)
+    fares = _df["Seat Fare"].to_numpy()
+    masks = [(fares >= fare_range[0]) & (fares <= fare_range[1])]
+    selections = [routes, categories, times, bus_types, genders, age_groups]
+    for col, selected in zip(FILTER_COLUMNS, selections):
+        if selected:
+            wanted = np.array([code_maps[col][label] for label in selected
+                               if label in code_maps[col]], dtype=np.int16)
+            masks.append(np.isin(code_arrays[col], wanted))
+    mask = np.logical_and.reduce(masks)
+    return None if mask.all() else np.flatnonzero(mask)
+
+
+def most_common(series):
+    """Most frequent value of ``series`` via a hash count + argmax (no sort, unlike ``mode``)."""
+    counts = series.value_counts(sort=False)
+    return counts.index[counts.to_numpy().argmax()] if len(counts) else "N/A"
+
+
+def multi_seat_share(data):
+    """Percentage of bookings whose total exceeds a single seat fare."""
+    total = data["Total Ticket Amount"].to_numpy()
+    fare = data["Seat Fare"].to_numpy()
+    return np.count_nonzero(total > fare) * 100 / len(total) if len(total) else 0.0
+
+
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES)
+def strategic_insights(_fdf, filter_key):
+    """Headline insights for the filtered frame, memoised per ``filter_key``."""
+    return {
+        "top_route": most_common(_fdf["Route"]),
+        "top_time": most_common(_fdf["Time Of Travel"]),
+        "dominant_gender": most_common(_fdf["Gender"]),
+        "dominant_age": most_common(_fdf["Age Group"]),
+        "multi_seat_pct": multi_seat_share(_fdf),
+    }
+
+
+def aggregate_cube(code_arrays, labels, revenue):
+    """Dense revenue-sum and row-count cube over FILTER_COLUMNS.
+
+    Each axis is indexed by one column's category code, so any filtered
+    aggregate is a slice-and-sum of the cube. Every axis has one extra,
+    trailing slot for a missing label (code -1), so a row missing e.g. its
+    Age Group still counts towards the Route × Category totals; only the
+    axes being displayed drop that slot (see ``cube_crosstab``).
+    """
+    shape = tuple(len(labels[c]) + 1 for c in FILTER_COLUMNS)
+    codes = [
+        np.where(code_arrays[c] < 0, len(labels[c]), code_arrays[c]).astype(np.intp)
+        for c in FILTER_COLUMNS
+    ]
+    cells = np.ravel_multi_index(codes, shape)
+    size = int(np.prod(shape))
+    return {
+        "sums": np.bincount(cells, weights=revenue, minlength=size).reshape(shape),
+        "counts": np.bincount(cells, minlength=size).reshape(shape),
+        "labels": labels,
+    }
+
+
+@st.cache_resource
+def full_cube(_df):
+    """Aggregate cube over the whole dataset, built once per loaded frame."""
+    code_arrays, code_maps = filter_codes(_df)
+    labels = {c: list(code_maps[c]) for c in FILTER_COLUMNS}
+    cube = aggregate_cube(code_arrays, labels, _df["Total Ticket Amount"].to_numpy())
+    cube["fare_span"] = (_df["Seat Fare"].min(), _df["Seat Fare"].max())
+
+    # One-off sanity check against the groupby the cube stands in for.
+    expected = _df.groupby(["Route", "Category"], observed=True)["Total Ticket Amount"].sum()
+    got = grouped_sum(cube, "Route", "Category").set_index(["Route", "Category"])
+    got = got["Total Ticket Amount"].reindex(expected.index.to_flat_index())
+    assert np.allclose(got.to_numpy(), expected.to_numpy(dtype=np.float64), rtol=1e-5)
+    return cube
+
+
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES)
+def filtered_cube(_df, _rows, filter_key):
+    """Aggregate cube for the current filters, memoised per ``filter_key``.
+
+    Categorical selections only zero out unselected slices of the full cube
+    (including the missing-label slot, which ``filter_rows`` excludes too).
+    A fare range that excludes rows can't be expressed on the cube, so it is
+    rebuilt from the matching ``_rows`` instead.
+    """
+    cube = full_cube(_df)
+    fare_range = filter_key[-1]
+    if fare_range[0] > cube["fare_span"][0] or fare_range[1] < cube["fare_span"][1]:
+        code_arrays, _ = filter_codes(_df)
+        rows = slice(None) if _rows is None else _rows
+        return aggregate_cube({c: a[rows] for c, a in code_arrays.items()}, cube["labels"],
+                              _df["Total Ticket Amount"].to_numpy()[rows])
+
+    _, code_maps = filter_codes(_df)
+    sums, counts = cube["sums"], cube["counts"]
+    for axis, (col, selected) in enumerate(zip(FILTER_COLUMNS, filter_key[:-1])):
+        if selected:
+            keep = np.zeros(counts.shape[axis], dtype=bool)
+            keep[[code_maps[col][label] for label in selected if label in code_maps[col]]] = True
+            keep = keep.reshape([-1 if a == axis else 1 for a in range(counts.ndim)])
+            sums = sums * keep
+            counts = counts * keep
+    return {"sums": sums, "counts": counts, "labels": cube["labels"]}
+
+
+def cube_crosstab(cube, index, columns, counts=False):
+    """``index`` × ``columns`` revenue (or row-count) grid summed out of ``cube``.
+
+    Rows missing either displayed label, and labels with no rows, are
+    dropped, as ``pd.pivot_table`` does.
+    """
+    i, j = FILTER_COLUMNS.index(index), FILTER_COLUMNS.index(columns)
+    other = tuple(a for a in range(cube["counts"].ndim) if a not in (i, j))
+    n = cube["counts"].sum(axis=other)[:-1, :-1]
+    grid = n if counts else cube["sums"].sum(axis=other)[:-1, :-1]
+    if i > j:
+        n, grid = n.T, grid.T
+
+    rows = n.any(axis=1)
+    cols = n.any(axis=0)
+    return pd.DataFrame(
+        grid[rows][:, cols],
+        index=pd.Index(np.asarray(cube["labels"][index], dtype=object)[rows], name=index),
+        columns=pd.Index(np.asarray(cube["labels"][columns], dtype=object)[cols], name=columns),
+    )
+
+
+def top_routes(cube, k=10):
+    """The ``k`` routes with the most tickets in ``cube``, busiest first.
+
+    ``argpartition`` finds the ``k``-th largest count; every route at or above
+    it (so all routes tied at the boundary) is then stably sorted, which keeps
+    ties in route label order. The cube's missing-route slot is excluded, so
+    the counts match ``value_counts()`` on the filtered rows.
+    """
+    axis = FILTER_COLUMNS.index("Route")
+    counts = cube["counts"].sum(axis=tuple(a for a in range(cube["counts"].ndim) if a != axis))
+    counts = counts[:-1]
+    k = min(k, len(counts))
+    threshold = counts[np.argpartition(-counts, k - 1)[k - 1]]
+    candidates = np.flatnonzero(counts >= max(threshold, 1))
+    top = candidates[np.argsort(-counts[candidates], kind="stable")][:k]
+    return pd.DataFrame({
+        "Route": np.asarray(cube["labels"]["Route"], dtype=object)[top],
+        "Tickets": counts[top],
+    })
+
+
+def grouped_sum(cube, index, columns, values="Total Ticket Amount"):
+    """Long-format revenue totals per (``index``, ``columns``) pair, for bar charts.
+
+    Only pairs that have bookings are emitted, as ``groupby(...).sum()`` does.
+    """
+    totals = cube_crosstab(cube, index, columns).stack()
+    booked = cube_crosstab(cube, index, columns, counts=True).stack() > 0
+    return totals[booked].reset_index(name=values)
+
+
+SCATTER_MAX_POINTS = 5000
+
+
+def scatter_sample(data, max_points=SCATTER_MAX_POINTS):
+    """Per-Category stratified sample of roughly ``max_points`` rows for scatter plots."""
+    if len(data) <= max_points:
+        return data
+    return data.groupby("Category", observed=True).sample(
+        frac=max_points / len(data), random_state=0
+    )
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES)
+def cached_figure(kind, data, layout=None, **kwargs):
+    """``px.<kind>(data, **kwargs)`` as a figure dict, memoised on its inputs.
+
+    Only pass small aggregated frames here, never the row-level data, so the
+    cache key stays cheap to hash.
+    """
+    fig = getattr(px, kind)(data, **kwargs)
+    if layout:
+        fig.update_layout(**layout)
+    return fig.to_dict()
+
+
+@st.cache_data(max_entries=CSV_CACHE_ENTRIES)
+def csv_bytes(_fdf, filter_key):
+    """UTF-8 CSV export of the filtered frame, memoised per ``filter_key``."""
+    return _fdf.to_csv(index=False).encode("utf-8")
+
+
 df = load_and_preprocess()
+assert df["Total Ticket Amount"].dtype == np.float32
+options = filter_options(df)
 
 # ======================== SIDEBAR FILTERS ========================
 st.sidebar.header("🔎 Filters")
 
-routes = sorted(df["Route"].unique())
-categories = sorted(df["Category"].unique())
-times = ["Early Morning", "Day Service", "Evening", "Overnight"]
-genders = sorted(df["Gender"].unique())
+routes = options["routes"]
+categories = options["categories"]
+times = TIME_BUCKETS
+genders = options["genders"]
 age_groups = ["1-17", "18-25", "26-40", "41-60", "60+"]
 
 sel_routes = st.sidebar.multiselect("Route", routes)
@@ -99,25 +393,23 @@ sel_genders = st.sidebar.multiselect("Gender", genders)
 sel_ages = st.sidebar.multiselect("Age Group", age_groups)
 fare_range = st.sidebar.slider(
     "Seat Fare Range (₹)",
-    int(df["Seat Fare"].min()),
-    int(df["Seat Fare"].max()),
-    (int(df["Seat Fare"].min()), int(df["Seat Fare"].max())),
+    options["fare_min"],
+    options["fare_max"],
+    (options["fare_min"], options["fare_max"]),
 )
 
-fdf = df.copy()
-if sel_routes:
-    fdf = fdf[fdf["Route"].isin(sel_routes)]
-if sel_categories:
-    fdf = fdf[fdf["Category"].isin(sel_categories)]
-if sel_times:
-    fdf = fdf[fdf["Time Of Travel"].isin(sel_times)]
-if sel_bus:
-    fdf = fdf[fdf["Bus Type"].isin(sel_bus)]
-if sel_genders:
-    fdf = fdf[fdf["Gender"].isin(sel_genders)]
-if sel_ages:
-    fdf = fdf[fdf["Age Group"].astype(str).isin(sel_ages)]
-fdf = fdf[(fdf["Seat Fare"] >= fare_range[0]) & (fdf["Seat Fare"] <= fare_range[1])]
+filter_key = (
+    tuple(sorted(sel_routes)),
+    tuple(sorted(sel_categories)),
+    tuple(sorted(sel_times)),
+    tuple(sorted(sel_bus)),
+    tuple(sorted(sel_genders)),
+    tuple(sorted(sel_ages)),
+    tuple(fare_range),
+)
+rows = filter_rows(df, *filter_key)
+fdf = df if rows is None else df.iloc[rows]
+cube = filtered_cube(df, rows, filter_key)
 
 n = len(fdf)
 
@@ -126,12 +418,15 @@ st.title("🚌 Freshbus — Travel & Booking Analysis Dashboard")
 st.caption("Interactive dashboard based on the Freshbus ticket dataset")
 
 # ======================== KPI CARDS ========================
+kpis = fdf.agg({"Seat Fare": "mean", "Booking Gap Days": "mean"})
+# Fares are float32; accumulate revenue in float64 so large totals stay exact.
+kpis["Total Ticket Amount"] = np.add.reduce(fdf["Total Ticket Amount"].to_numpy(), dtype=np.float64)
 k1, k2, k3, k4, k5 = st.columns(5)
 k1.metric("Total Tickets", f"{n:,}")
-k2.metric("Avg Fare", f"₹{fdf['Seat Fare'].mean():,.0f}" if n else "—")
-k3.metric("Total Revenue", f"₹{fdf['Total Ticket Amount'].sum():,.0f}" if n else "—")
+k2.metric("Avg Fare", f"₹{kpis['Seat Fare']:,.0f}" if n else "—")
+k3.metric("Total Revenue", f"₹{kpis['Total Ticket Amount']:,.0f}" if n else "—")
 k4.metric("Unique Routes", fdf["Route"].nunique())
-k5.metric("Avg Booking Gap", f"{fdf['Booking Gap Days'].mean():.1f} days" if n else "—")
+k5.metric("Avg Booking Gap", f"{kpis['Booking Gap Days']:.1f} days" if n else "—")
 
 if n == 0:
     st.warning("No data matches the current filters. Adjust filters in the sidebar.")
@@ -149,16 +444,16 @@ with tab_overview:
     st.subheader("Bus Type Preference (Seater vs Sleeper)")
     c1, c2 = st.columns(2)
     with c1:
-        bus_counts = fdf["Bus Type"].value_counts().reset_index()
+        bus_counts = fdf["Bus Type"].value_counts().loc[lambda s: s > 0].reset_index()
         bus_counts.columns = ["Bus Type", "Bookings"]
-        fig = px.pie(bus_counts, names="Bus Type", values="Bookings",
-                     hole=0.45, color_discrete_sequence=px.colors.qualitative.Set2)
-        fig.update_layout(margin=dict(t=30, b=30))
-        st.plotly_chart(fig, use_container_width=True)
+        fig = cached_figure("pie", bus_counts, names="Bus Type", values="Bookings",
+                            hole=0.45, color_discrete_sequence=px.colors.qualitative.Set2,
+                            layout=dict(margin=dict(t=30, b=30)))
+        st.plotly_chart(go.Figure(fig), use_container_width=True)
     with c2:
-        fig = px.bar(bus_counts, x="Bus Type", y="Bookings",
-                     color="Bus Type", color_discrete_sequence=px.colors.qualitative.Set2)
-        st.plotly_chart(fig, use_container_width=True)
+        fig = cached_figure("bar", bus_counts, x="Bus Type", y="Bookings",
+                            color="Bus Type", color_discrete_sequence=px.colors.qualitative.Set2)
+        st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
@@ -179,57 +474,55 @@ with tab_overview:
     st.subheader("Bookings by Time of Travel")
     time_counts = fdf["Time Of Travel"].value_counts().reindex(times).reset_index()
     time_counts.columns = ["Time Of Travel", "Bookings"]
-    fig = px.bar(time_counts, x="Time Of Travel", y="Bookings",
-                 color="Time Of Travel", color_discrete_sequence=px.colors.qualitative.Vivid)
-    st.plotly_chart(fig, use_container_width=True)
+    fig = cached_figure("bar", time_counts, x="Time Of Travel", y="Bookings",
+                        color="Time Of Travel", color_discrete_sequence=px.colors.qualitative.Vivid)
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
 # ------------------------------------------------------------------ #
 # TAB 2 — ROUTE ANALYSIS
 # ------------------------------------------------------------------ #
 with tab_routes:
     st.subheader("Top 10 Routes by Ticket Count")
-    top10 = fdf["Route"].value_counts().head(10).reset_index()
-    top10.columns = ["Route", "Tickets"]
-    fig = px.bar(top10, x="Route", y="Tickets", color="Tickets",
-                 color_continuous_scale="Viridis")
-    st.plotly_chart(fig, use_container_width=True)
+    top10 = top_routes(cube)
+    fig = cached_figure("bar", top10, x="Route", y="Tickets", color="Tickets",
+                        color_continuous_scale="Viridis")
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Revenue by Route × Category
     st.subheader("Revenue by Route & Category")
-    rev_rc = fdf.groupby(["Route", "Category"])["Total Ticket Amount"].sum().reset_index()
-    fig = px.bar(rev_rc, x="Route", y="Total Ticket Amount", color="Category",
-                 barmode="group", color_discrete_sequence=px.colors.qualitative.Prism)
-    fig.update_layout(xaxis_tickangle=-45)
-    st.plotly_chart(fig, use_container_width=True)
+    rev_rc = grouped_sum(cube, "Route", "Category")
+    fig = cached_figure("bar", rev_rc, x="Route", y="Total Ticket Amount", color="Category",
+                        barmode="group", color_discrete_sequence=px.colors.qualitative.Prism,
+                        layout=dict(xaxis_tickangle=-45))
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Revenue by Route × Time of Travel
     st.subheader("Revenue by Route & Time of Travel")
-    rev_rt = fdf.groupby(["Route", "Time Of Travel"])["Total Ticket Amount"].sum().reset_index()
-    fig = px.bar(rev_rt, x="Route", y="Total Ticket Amount", color="Time Of Travel",
-                 barmode="group", color_discrete_sequence=px.colors.qualitative.Bold)
-    fig.update_layout(xaxis_tickangle=-45)
-    st.plotly_chart(fig, use_container_width=True)
+    rev_rt = grouped_sum(cube, "Route", "Time Of Travel")
+    fig = cached_figure("bar", rev_rt, x="Route", y="Total Ticket Amount",
+                        color="Time Of Travel", barmode="group",
+                        color_discrete_sequence=px.colors.qualitative.Bold,
+                        layout=dict(xaxis_tickangle=-45))
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Heatmaps
     st.subheader("Revenue Heatmap — Route × Time of Travel")
-    pivot_rev = pd.pivot_table(fdf, values="Total Ticket Amount",
-                               index="Route", columns="Time Of Travel", aggfunc="sum").fillna(0)
-    fig = px.imshow(pivot_rev, text_auto=".0f", color_continuous_scale="YlOrRd", aspect="auto")
-    fig.update_layout(height=500)
-    st.plotly_chart(fig, use_container_width=True)
+    pivot_rev = cube_crosstab(cube, "Route", "Time Of Travel")
+    fig = cached_figure("imshow", pivot_rev, text_auto=".0f", color_continuous_scale="YlOrRd",
+                        aspect="auto", layout=dict(height=500))
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.subheader("Booking Volume Heatmap — Route × Time of Travel")
-    pivot_cnt = pd.pivot_table(fdf, values="Ticket No",
-                               index="Route", columns="Time Of Travel", aggfunc="count").fillna(0)
-    fig = px.imshow(pivot_cnt, text_auto=".0f", color_continuous_scale="Viridis", aspect="auto")
-    fig.update_layout(height=500)
-    st.plotly_chart(fig, use_container_width=True)
+    pivot_cnt = cube_crosstab(cube, "Route", "Time Of Travel", counts=True)
+    fig = cached_figure("imshow", pivot_cnt, text_auto="d", color_continuous_scale="Viridis",
+                        aspect="auto", layout=dict(height=500))
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
 # ------------------------------------------------------------------ #
 # TAB 3 — DEMOGRAPHICS
@@ -240,41 +533,45 @@ with tab_demographics:
     with c1:
         age_counts = fdf["Age Group"].value_counts().sort_index().reset_index()
         age_counts.columns = ["Age Group", "Bookings"]
-        fig = px.bar(age_counts, x="Age Group", y="Bookings",
-                     color="Age Group", color_discrete_sequence=px.colors.qualitative.Pastel)
-        st.plotly_chart(fig, use_container_width=True)
+        fig = cached_figure("bar", age_counts, x="Age Group", y="Bookings",
+                            color="Age Group", color_discrete_sequence=px.colors.qualitative.Pastel)
+        st.plotly_chart(go.Figure(fig), use_container_width=True)
     with c2:
-        gender_counts = fdf["Gender"].value_counts().reset_index()
+        gender_counts = fdf["Gender"].value_counts().loc[lambda s: s > 0].reset_index()
         gender_counts.columns = ["Gender", "Bookings"]
-        fig = px.pie(gender_counts, names="Gender", values="Bookings",
-                     hole=0.4, color_discrete_sequence=px.colors.qualitative.Set1,
-                     title="Bookings by Gender")
-        st.plotly_chart(fig, use_container_width=True)
+        fig = cached_figure("pie", gender_counts, names="Gender", values="Bookings",
+                            hole=0.4, color_discrete_sequence=px.colors.qualitative.Set1,
+                            title="Bookings by Gender")
+        st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Age Group × Category
     st.subheader("Age Group Distribution Across Categories")
-    age_cat = fdf.groupby(["Category", "Age Group"], observed=False).size().reset_index(name="Count")
-    fig = px.bar(age_cat, x="Category", y="Count", color="Age Group",
-                 barmode="group", color_discrete_sequence=px.colors.qualitative.Safe)
-    st.plotly_chart(fig, use_container_width=True)
+    age_cat = fdf.groupby(["Category", "Age Group"], observed=True).size().reset_index(name="Count")
+    fig = cached_figure("bar", age_cat, x="Category", y="Count", color="Age Group",
+                        barmode="group", color_discrete_sequence=px.colors.qualitative.Safe)
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Gender × Time of Travel
     st.subheader("Gender-wise Travel Time Preference")
-    gen_time = fdf.groupby(["Gender", "Time Of Travel"]).size().reset_index(name="Bookings")
-    fig = px.bar(gen_time, x="Time Of Travel", y="Bookings", color="Gender",
-                 barmode="group", color_discrete_sequence=px.colors.qualitative.Plotly)
-    st.plotly_chart(fig, use_container_width=True)
+    gen_time = (
+        fdf.groupby(["Gender", "Time Of Travel"], observed=True)
+        .size()
+        .reset_index(name="Bookings")
+    )
+    fig = cached_figure("bar", gen_time, x="Time Of Travel", y="Bookings", color="Gender",
+                        barmode="group", color_discrete_sequence=px.colors.qualitative.Plotly)
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Gender × Time × Age stacked
     st.subheader("Gender Booking Pattern by Time & Age Group")
     gen_time_age = (
-        fdf.groupby(["Gender", "Time Of Travel", "Age Group"], observed=False)
+        fdf.groupby(["Gender", "Time Of Travel", "Age Group"], observed=True)
         .size()
         .reset_index(name="Bookings")
     )
@@ -282,10 +579,10 @@ with tab_demographics:
     for col_widget, g in zip([c1, c2], sorted(fdf["Gender"].unique())):
         with col_widget:
             sub = gen_time_age[gen_time_age["Gender"] == g]
-            fig = px.bar(sub, x="Time Of Travel", y="Bookings", color="Age Group",
-                         title=f"Gender: {g}", barmode="stack",
-                         color_discrete_sequence=px.colors.qualitative.Pastel)
-            st.plotly_chart(fig, use_container_width=True)
+            fig = cached_figure("bar", sub, x="Time Of Travel", y="Bookings", color="Age Group",
+                                title=f"Gender: {g}", barmode="stack",
+                                color_discrete_sequence=px.colors.qualitative.Pastel)
+            st.plotly_chart(go.Figure(fig), use_container_width=True)
 
 # ------------------------------------------------------------------ #
 # TAB 4 — BOOKING BEHAVIOUR
@@ -308,17 +605,18 @@ with tab_booking:
 
     # Category × Time of Travel revenue
     st.subheader("Revenue by Category & Time of Travel")
-    cat_time = fdf.groupby(["Category", "Time Of Travel"])["Total Ticket Amount"].sum().reset_index()
-    fig = px.bar(cat_time, x="Category", y="Total Ticket Amount", color="Time Of Travel",
-                 barmode="group", color_discrete_sequence=px.colors.qualitative.Vivid)
-    st.plotly_chart(fig, use_container_width=True)
+    cat_time = grouped_sum(cube, "Category", "Time Of Travel")
+    fig = cached_figure("bar", cat_time, x="Category", y="Total Ticket Amount",
+                        color="Time Of Travel", barmode="group",
+                        color_discrete_sequence=px.colors.qualitative.Vivid)
+    st.plotly_chart(go.Figure(fig), use_container_width=True)
 
     st.divider()
 
     # Fare vs Total Amount scatter
     st.subheader("Seat Fare vs Total Ticket Amount")
-    fig = px.scatter(fdf, x="Seat Fare", y="Total Ticket Amount",
-                     color="Category", hover_data=["Route", "Bus Type"],
+    fig = px.scatter(scatter_sample(fdf), x="Seat Fare", y="Total Ticket Amount",
+                     color="Category", hover_data=["Route", "Bus Type"], render_mode="webgl",
                      opacity=0.6, color_discrete_sequence=px.colors.qualitative.Prism)
     st.plotly_chart(fig, use_container_width=True)
 
@@ -326,22 +624,17 @@ with tab_booking:
 
     # Strategic insights
     st.subheader("🧠 Strategic Insights")
-    top_route = fdf["Route"].mode().iloc[0]
-    top_time = fdf["Time Of Travel"].mode().iloc[0]
-    dominant_gender = fdf["Gender"].mode().iloc[0]
-    dominant_age = fdf["Age Group"].mode().iloc[0]
-    multi_seat_pct = (fdf["Total Ticket Amount"] > fdf["Seat Fare"]).mean() * 100
-    avg_gap = fdf["Booking Gap Days"].mean()
+    insights = strategic_insights(fdf, filter_key)
 
     st.markdown(f"""
 | Insight | Detail |
 |---------|--------|
-| **Most Booked Route** | {top_route} |
-| **Peak Travel Time** | {top_time} |
-| **Dominant Gender** | {dominant_gender} |
-| **Most Active Age Group** | {dominant_age} |
-| **Multi-seat Bookings** | {multi_seat_pct:.1f}% |
-| **Avg Booking Gap** | {avg_gap:.1f} days |
+| **Most Booked Route** | {insights['top_route']} |
+| **Peak Travel Time** | {insights['top_time']} |
+| **Dominant Gender** | {insights['dominant_gender']} |
+| **Most Active Age Group** | {insights['dominant_age']} |
+| **Multi-seat Bookings** | {insights['multi_seat_pct']:.1f}% |
+| **Avg Booking Gap** | {kpis['Booking Gap Days']:.1f} days |
 """)
 
 # ------------------------------------------------------------------ #
@@ -350,6 +643,5 @@ with tab_booking:
 with tab_data:
     st.subheader("Filtered Dataset")
     st.dataframe(fdf, use_container_width=True, height=500)
-    csv = fdf.to_csv(index=False).encode("utf-8")
-    st.download_button("📥 Download Filtered CSV", data=csv,
+    st.download_button("📥 Download Filtered CSV", data=lambda: csv_bytes(fdf, filter_key),
                        file_name="filtered_bus_data.csv", mime="text/csv")